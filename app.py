@@ -1,5 +1,8 @@
+from typing import NamedTuple
+
+import numpy as np
 import streamlit as st
-import pandas as pd
+from matplotlib import colormaps
 
 # -----------------------------
 # CONFIG & CONSTANTS
@@ -11,50 +14,78 @@ ZONING = {
     "MU2 (High Density Mixed - 4.0 FF)": {"ff": 4.0, "coverage": 1.0},
     "GB7 (CBD/High Rise - 12.0 FF)": {"ff": 12.0, "coverage": 1.0},
 }
+ZONE_NAMES = list(ZONING.keys())
+ZONE_FF = {name: zone["ff"] for name, zone in ZONING.items()}
 
 DC_RATE = 514.10      # ZAR per m2 (estimate)
 IH_CAP_PRICE = 15000  # Affordable cap price
 
+IH_MAX = 30      # Upper bound of the Inclusionary Housing slider (%)
+BONUS_MAX = 100  # Upper bound of the Density Bonus slider (%)
+
+# Construction cost multiplier per parking zone (less parking to build)
+PARKING_MULT = {
+    "Standard": 1.0,
+    "PT1 (Reduced)": 0.95,
+    "PT2 (Zero)": 0.85,
+}
+PARKING_ZONES = list(PARKING_MULT.keys())
+
+PAGE_TITLE = "CPT Property Redevelopment Calc"
+CSS = """
+<style>
+.main { background-color: #f5f7f9; }
+.stMetric { background-color: #ffffff; padding: 15px; border-radius: 10px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+</style>
+"""
+
+
+class Metrics(NamedTuple):
+    rlv: float
+    bulk: float
+    dcs: float
+    gdv: float
+
+
+class RlvSurface(NamedTuple):
+    """RLV coefficients per m² of base bulk (land x FF), indexed [ih %, bonus %]."""
+    price: np.ndarray
+    cost: np.ndarray
+    base: np.ndarray
+
+
+class SensitivityTable(NamedTuple):
+    values: np.ndarray
+    index: list
+    columns: list
+
 
 # -----------------------------
 # HELPERS
 # -----------------------------
 def apply_css() -> None:
-    st.set_page_config(page_title="CPT Property Redevelopment Calc", layout="wide")
-    st.markdown(
-        """
-        <style>
-        .main { background-color: #f5f7f9; }
-        .stMetric { background-color: #ffffff; padding: 15px; border-radius: 10px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.set_page_config(page_title=PAGE_TITLE, layout="wide")
+    st.markdown(CSS, unsafe_allow_html=True)
 
 
 def get_inputs():
     st.sidebar.title("🛠️ Development Inputs")
 
     land_size = st.sidebar.number_input("Land Area (m²)", value=1000, step=100, min_value=1)
-    zone_choice = st.sidebar.selectbox("Zoning Preset", list(ZONING.keys()))
-    parking_zone = st.sidebar.radio("Parking Zone", ["Standard", "PT1 (Reduced)", "PT2 (Zero)"])
+    zone_choice = st.sidebar.selectbox("Zoning Preset", ZONE_NAMES)
+    parking_zone = st.sidebar.radio("Parking Zone", PARKING_ZONES)
 
     st.sidebar.subheader("Market Assumptions")
     market_price = st.sidebar.slider("Market Sales Price (R/m²)", 20000, 80000, 45000)
     const_cost_base = st.sidebar.slider("Base Construction (R/m²)", 12000, 25000, 17000)
 
     # Adjust cost based on parking zone
-    if parking_zone == "PT2 (Zero)":
-        const_cost = const_cost_base * 0.85
-    elif parking_zone == "PT1 (Reduced)":
-        const_cost = const_cost_base * 0.95
-    else:
-        const_cost = const_cost_base
+    const_cost = const_cost_base * PARKING_MULT[parking_zone]
 
     st.sidebar.subheader("Policy Sensitivity")
-    ih_req = st.sidebar.slider("Inclusionary Housing (%)", 0, 30, 20)
-    density_bonus = st.sidebar.slider("Density Bonus (%)", 0, 100, 20)
+    ih_req = st.sidebar.slider("Inclusionary Housing (%)", 0, IH_MAX, 20)
+    density_bonus = st.sidebar.slider("Density Bonus (%)", 0, BONUS_MAX, 20)
 
     return {
         "land_size": land_size,
@@ -67,6 +98,31 @@ def get_inputs():
     }
 
 
+@st.cache_resource
+def build_rlv_surface():
+    # RLV = GDV - construction - DCs - fees (12.5% of construction) - profit (20% of GDV)
+    # is linear in base bulk, market price and construction cost, so every reachable
+    # IH/bonus combination reduces to three coefficients:
+    #   rlv = land * ff * (price * m_price + cost * c_cost + base)
+    ih = np.arange(IH_MAX + 1, dtype=np.float64).reshape(-1, 1) / 100
+    bulk = 1 + np.arange(BONUS_MAX + 1, dtype=np.float64).reshape(1, -1) / 100
+    market_bulk = bulk * (1 - ih)
+
+    return RlvSurface(
+        price=0.80 * market_bulk,
+        cost=np.broadcast_to(-1.125 * bulk, market_bulk.shape),
+        base=0.80 * (bulk * ih) * IH_CAP_PRICE - market_bulk * DC_RATE,
+    )
+
+
+def surface_rlv(land, ff, m_price, c_cost, cells):
+    surface = build_rlv_surface()
+    return (land * ff) * (
+        surface.price[cells] * m_price + surface.cost[cells] * c_cost + surface.base[cells]
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
 def calculate_metrics(land, ff, bonus, ih, m_price, c_cost):
     total_bulk = (land * ff) * (1 + (bonus / 100))
     ih_bulk = total_bulk * (ih / 100)
@@ -74,39 +130,63 @@ def calculate_metrics(land, ff, bonus, ih, m_price, c_cost):
 
     gdv = (market_bulk * m_price) + (ih_bulk * IH_CAP_PRICE)
     dev_charges = market_bulk * DC_RATE
-    construction = total_bulk * c_cost
-    fees = construction * 0.125
-    profit_target = gdv * 0.20
 
-    rlv = gdv - construction - dev_charges - fees - profit_target
-    return {
-        "rlv": rlv,
-        "bulk": total_bulk,
-        "dcs": dev_charges,
-        "gdv": gdv,
-    }
+    # RLV comes from the shared surface so the KPI row and sensitivity grid agree exactly
+    rlv = surface_rlv(land, ff, m_price, c_cost, (ih, bonus))
+    return Metrics(rlv, total_bulk, dev_charges, gdv)
 
 
 @st.cache_data(show_spinner=False)
 def build_sensitivity_table(land_size, ff_val, market_price, const_cost):
-    matrix = []
     ih_levels = [0, 10, 20, 30]
     bonus_levels = [0, 20, 40, 60, 80, 100]
 
-    for ih in ih_levels:
-        row = []
-        for b in bonus_levels:
-            out = calculate_metrics(land_size, ff_val, b, ih, market_price, const_cost)
-            row.append(round(out["rlv"] / 1e6, 2))
-        matrix.append(row)
+    rlv = surface_rlv(land_size, ff_val, market_price, const_cost, np.ix_(ih_levels, bonus_levels))
+    rlv_matrix = np.ascontiguousarray(np.round(rlv / 1e6, 2), dtype=np.float64)
 
-    return pd.DataFrame(
-        matrix,
+    return SensitivityTable(
+        values=rlv_matrix,
         index=[f"{i}% IH" for i in ih_levels],
         columns=[f"+{b}% Bonus" for b in bonus_levels],
     )
 
 
+def _gradient_colours(values):
+    """Map a matrix onto RdYlGn, returning background and text hex colours per cell."""
+    lo, hi = values.min(), values.max()
+    norm = (values - lo) / (hi - lo) if hi > lo else np.zeros_like(values)
+    rgb = colormaps["RdYlGn"](norm)[..., :3]
+
+    rgb_int = np.rint(rgb * 255).astype(np.int64)
+    hex_int = (rgb_int[..., 0] << 16) | (rgb_int[..., 1] << 8) | rgb_int[..., 2]
+    bg = np.vectorize("#{:06x}".format)(hex_int)
+
+    # Same contrast rule as pandas' background_gradient: light text on dark cells
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+    fg = np.where(luminance < 0.408, "#f1f1f1", "#000000")
+    return bg, fg
+
+
+@st.cache_data(show_spinner=False)
+def build_sensitivity_html(land_size, ff_val, market_price, const_cost):
+    table = build_sensitivity_table(land_size, ff_val, market_price, const_cost)
+    values = table.values
+    bg, fg = _gradient_colours(values)
+
+    header = "".join(f"<th>{col}</th>" for col in table.columns)
+    rows = "".join(
+        f"<tr><th>{label}</th>"
+        + "".join(
+            f'<td style="background-color: {bg[i, j]}; color: {fg[i, j]}">{values[i, j]:.2f}</td>'
+            for j in range(values.shape[1])
+        )
+        + "</tr>"
+        for i, label in enumerate(table.index)
+    )
+    return f"<table><thead><tr><th></th>{header}</tr></thead><tbody>{rows}</tbody></table>"
+
+
 def render_header(inputs):
     st.title("Cape Town Residual Land Value Calculator")
     st.info(
@@ -116,18 +196,25 @@ def render_header(inputs):
 
 
 def render_metrics(outputs):
+    rlv_m = max(0.0, outputs.rlv) / 1e6
+    dcs_k = outputs.dcs / 1e3
+    gdv_m = outputs.gdv / 1e6
+
     c1, c2, c3, c4 = st.columns(4)
 
-    c1.metric(label="Residual Land Value", value=f"R {max(0, outputs['rlv'] / 1e6):.2f}M")
-    c2.metric(label="Total Bulk (GBA)", value=f"{outputs['bulk']:,.0f} m²")
-    c3.metric(label="Dev Charges", value=f"R {outputs['dcs'] / 1e3:,.0f}k")
-    c4.metric(label="Total GDV", value=f"R {outputs['gdv'] / 1e6:.2f}M")
+    c1.metric(label="Residual Land Value", value=f"R {rlv_m:.2f}M")
+    c2.metric(label="Total Bulk (GBA)", value=f"{outputs.bulk:,.0f} m²")
+    c3.metric(label="Dev Charges", value=f"R {dcs_k:,.0f}k")
+    c4.metric(label="Total GDV", value=f"R {gdv_m:.2f}M")
 
 
-def render_sensitivity(df_map):
+def render_sensitivity(land_size, ff_val, market_price, const_cost):
     st.subheader("Sensitivity: How Density Bonuses offset Inclusionary Requirements")
     st.write("### Land Value Matrix (ZAR Millions)")
-    st.dataframe(df_map.style.background_gradient(cmap="RdYlGn", axis=None))
+    st.markdown(
+        build_sensitivity_html(land_size, ff_val, market_price, const_cost),
+        unsafe_allow_html=True,
+    )
     st.caption(
         "Note: Green cells indicate higher land value. Red/Yellow indicates the policy is making the land less valuable."
     )
@@ -139,7 +226,7 @@ def main():
     # UI guard: show helpful errors in the app instead of a blank crash
     try:
         inputs = get_inputs()
-        ff_val = ZONING[inputs["zone_choice"]]["ff"]
+        ff_val = ZONE_FF[inputs["zone_choice"]]
 
         outputs = calculate_metrics(
             inputs["land_size"],
@@ -153,10 +240,9 @@ def main():
         render_header(inputs)
         render_metrics(outputs)
 
-        df_map = build_sensitivity_table(
+        render_sensitivity(
             inputs["land_size"], ff_val, inputs["market_price"], inputs["const_cost"]
         )
-        render_sensitivity(df_map)
 
     except Exception as e:
         st.error("Something went wrong while running the app.")